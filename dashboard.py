@@ -1,58 +1,1256 @@
 from pathlib import Path
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
 import plotly.graph_objects as go
 import os
 import re
+import json
+import math
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
 
 
 st.set_page_config(page_title="Dashboard", layout="wide")
 
 
+# --- DEDUPLIKACJA ---
+# survey_<uuid respondenta>_responses_<epoch w ms>.csv
+SURVEY_FILE_PATTERN = re.compile(r"survey_(?P<uuid>[0-9a-fA-F-]{36})_responses_(?P<epoch>\d+)\.csv$")
+DEDUP_INDEX_NAME = ".dedup_index.json"
+
+DEDUP_POLICIES = {
+    'first': 'Zachowaj pierwsze zgłoszenie',
+    'latest': 'Zachowaj najnowsze zgłoszenie',
+    'flag': 'Tylko oznacz duplikaty',
+}
+
+
+def parse_survey_filename(file_name):
+    match = SURVEY_FILE_PATTERN.search(file_name)
+    if not match:
+        return None, None
+    return match.group('uuid').lower(), int(match.group('epoch'))
+
+
+def dedup_rank(entries, name, policy):
+    """
+    Mniejszy klucz wygrywa. Pliki bez epoch w nazwie przegrywają z każdym
+    plikiem z epoch, niezależnie od polityki.
+    """
+    epoch = entries[name]['epoch']
+    if epoch is None:
+        return (1, 0, name)
+    return (0, -epoch if policy == 'latest' else epoch, name)
+
+
+def new_dedup_state():
+    return {
+        'by_respondent': {},      # uuid respondenta -> zachowany plik
+        'by_respondent_hash': {}, # hash -> dowolny plik z UUID o tej treści (także zastąpiony)
+        'by_plain_hash': {},      # hash -> zachowany plik bez UUID
+        'duplicates': set(),
+    }
+
+
+def register_dedup_file(state, entries, name, policy):
+    """
+    Dopisuje jeden plik do stanu deduplikacji w O(1). Reguły nie zależą od
+    kolejności dopisywania, więc indeks przyrostowy i przebudowa od zera dają
+    ten sam wynik:
+    - pliki z UUID są duplikatami tylko w obrębie tego samego respondenta
+      (różni respondenci mogą mieć identyczne odpowiedzi), wygrywa dedup_rank;
+    - plik bez UUID jest duplikatem, jeśli ma treść jakiegokolwiek pliku z UUID
+      (także zastąpionego zgłoszenia) albo lepszego w dedup_rank pliku bez UUID.
+    """
+    entry = entries[name]
+    respondent_id = entry['respondent']
+    content_hash = entry['hash']
+    duplicates = state['duplicates']
+
+    if respondent_id:
+        rival = state['by_respondent'].get(respondent_id)
+        if rival is not None and dedup_rank(entries, rival, policy) < dedup_rank(entries, name, policy):
+            duplicates.add(name)
+        else:
+            if rival is not None:
+                duplicates.add(rival)
+            state['by_respondent'][respondent_id] = name
+        state['by_respondent_hash'].setdefault(content_hash, name)
+        plain = state['by_plain_hash'].pop(content_hash, None)
+        if plain is not None:
+            duplicates.add(plain)
+        return
+
+    if content_hash in state['by_respondent_hash']:
+        duplicates.add(name)
+        return
+    rival = state['by_plain_hash'].get(content_hash)
+    if rival is not None and dedup_rank(entries, rival, policy) < dedup_rank(entries, name, policy):
+        duplicates.add(name)
+        return
+    if rival is not None:
+        duplicates.add(rival)
+    state['by_plain_hash'][content_hash] = name
+
+
+def build_dedup_state(entries, policy):
+    state = new_dedup_state()
+    for name in entries:
+        register_dedup_file(state, entries, name, policy)
+    return state
+
+
+def update_dedup_index(folder_path, files, policy, lock):
+    """
+    Wczytuje trwały indeks z folderu ankiety: opisy plików oraz, dla każdej
+    polityki, mapy respondent -> plik i hash -> plik. Nowe pliki są hashowane
+    i sprawdzane względem map; dopiero zmiana lub usunięcie już znanego pliku
+    wymusza przeliczenie stanu od zera. Zwraca posortowaną listę duplikatów.
+
+    Wywoływane równolegle z sesji i z wątku w tle, dlatego całość działa pod
+    blokadą folderu, a indeks zapisywany jest atomowo (plik tymczasowy + os.replace).
+    """
+    index_path = folder_path / DEDUP_INDEX_NAME
+    with lock:
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            known, states = index['files'], index['policies']
+            for state in states.values():
+                state['duplicates'] = set(state['duplicates'])
+        except (OSError, ValueError, KeyError, TypeError):
+            known, states = {}, {}
+
+        entries = {}
+        new_names = []
+        for file in files:
+            stat = file.stat()
+            entry = known.get(file.name)
+            if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+                respondent_id, epoch = parse_survey_filename(file.name)
+                entry = {
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime_ns,
+                    'hash': hashlib.sha256(file.read_bytes()).hexdigest(),
+                    'respondent': respondent_id,
+                    'epoch': epoch,
+                }
+                new_names.append(file.name)
+            entries[file.name] = entry
+
+        # zmieniony lub usunięty plik unieważnia zapisane mapy
+        if any(name in known for name in new_names) or any(name not in entries for name in known):
+            states = {}
+
+        for state_policy, state in states.items():
+            for name in new_names:
+                register_dedup_file(state, entries, name, state_policy)
+
+        changed = bool(new_names)
+        if policy not in states:
+            states[policy] = build_dedup_state(entries, policy)
+            changed = True
+
+        if changed:
+            serializable = {
+                state_policy: dict(state, duplicates=sorted(state['duplicates']))
+                for state_policy, state in states.items()
+            }
+            tmp_path = index_path.with_name(f"{DEDUP_INDEX_NAME}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({'files': entries, 'policies': serializable}, f, indent=1)
+                os.replace(tmp_path, index_path)
+            except OSError:
+                pass
+
+        return sorted(states[policy]['duplicates'])
+
+
+# --- KLIENCI I WSPÓLNY CACHE ---
+DEFAULT_CLIENT = 'default'
+CLIENTS_ROOT = Path(os.environ.get("DASHBOARD_CLIENTS_ROOT", "clients"))
+CACHE_BUDGET_MB = int(os.environ.get("DASHBOARD_CACHE_MB", "512"))
+
+
+def list_data_roots():
+    """
+    Klient domyślny to folder data/, pozostali to podfoldery CLIENTS_ROOT,
+    każdy z własnymi folderami hsc/, dms/ i ohix/. Podfolder o nazwie
+    klienta domyślnego jest pomijany, jeśli istnieje data/ - zwracany jest
+    wtedy jako drugi element wyniku.
+    """
+    data_roots = {}
+    rejected = []
+    if Path("data").is_dir():
+        data_roots[DEFAULT_CLIENT] = Path("data")
+    if CLIENTS_ROOT.is_dir():
+        for folder in sorted(CLIENTS_ROOT.iterdir()):
+            if not folder.is_dir() or folder.name.startswith('.'):
+                continue
+            if folder.name in data_roots:
+                rejected.append(folder)
+                continue
+            data_roots[folder.name] = folder
+    return data_roots, rejected
+
+
+class SharedLRUCache:
+    """
+    Cache wspólny dla wszystkich sesji w procesie, z limitem pamięci.
+    Po przekroczeniu limitu usuwane są najdawniej używane wpisy.
+    Zwracane obiekty są współdzielone, więc nie wolno ich modyfikować.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._named_locks = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value, size):
+        with self._lock:
+            if key in self._items:
+                self.used_bytes -= self._items.pop(key)[1]
+            if size > self.budget_bytes:
+                return
+            self._items[key] = (value, size)
+            self.used_bytes += size
+            while self.used_bytes > self.budget_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.used_bytes -= evicted_size
+
+    def lock_for(self, name):
+        """Trwała blokada o danej nazwie, wspólna dla wszystkich wątków procesu."""
+        with self._lock:
+            return self._named_locks.setdefault(name, threading.Lock())
+
+    def get_or_compute(self, key, compute, sizeof):
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        # Jeden wątek liczy dany klucz, pozostałe czekają na jego wynik,
+        # zamiast równolegle czytać te same pliki.
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                value = self.get(key)
+                if value is None:
+                    value = compute()
+                    self.put(key, value, sizeof(value))
+        finally:
+            with self._lock:
+                if self._key_locks.get(key) is key_lock:
+                    del self._key_locks[key]
+        return value
+
+
+class PassThroughCache:
+    """
+    Ten sam interfejs co SharedLRUCache, ale nic nie zapamiętuje. Dla zadań
+    wsadowych, które nie powinny wypierać danych aktywnych klientów; blokady
+    folderów bierze ze wspólnego cache.
+    """
+
+    def __init__(self, parent):
+        self._parent = parent
+
+    def lock_for(self, name):
+        return self._parent.lock_for(name)
+
+    def get_or_compute(self, key, compute, sizeof):
+        return compute()
+
+
+@st.cache_resource
+def get_shared_cache():
+    return SharedLRUCache(CACHE_BUDGET_MB * 1024 * 1024)
+
+
+def frame_size(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def payload_size(payload):
+    return len(json.dumps(payload))
+
+
+def folder_fingerprint(folder_path):
+    # Tylko stat() plików, bez czytania ich zawartości.
+    digest = hashlib.sha256()
+    for file in sorted(folder_path.glob("*.csv")):
+        stat = file.stat()
+        digest.update(f"{file.name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
 # --- DATA LOADER ---
-@st.cache_data
-def load_survey_data(survey_name):
-    folder_path = Path("data") / survey_name
-    
-    all_files = list(folder_path.glob("*.csv"))
-    
+def scan_survey_files(cache, data_root, survey_name, policy='first'):
+    folder_path = data_root / survey_name
+
+    all_files = sorted(file for file in folder_path.glob("*.csv") if os.path.getsize(file) > 0)
+    lock = cache.lock_for(('dedup', str(folder_path.resolve())))
+    duplicates = update_dedup_index(folder_path, all_files, policy, lock)
+
+    return [file.name for file in all_files], duplicates
+
+
+def read_survey_data(data_root, survey_name, scan, policy='first'):
+    folder_path = data_root / survey_name
+
+    all_files, duplicates = scan
+
     if not all_files:
         return pd.DataFrame()
-    
+
     df_list = []
-    for file in all_files:
-        if os.path.getsize(file) > 0:
-            try:
-                df = pd.read_csv(file)
-                df_list.append(df)
-            except pd.errors.EmptyDataError:
-                pass
-    
+    for file_name in all_files:
+        is_duplicate = file_name in duplicates
+        if is_duplicate and policy != 'flag':
+            continue
+        try:
+            df = pd.read_csv(folder_path / file_name)
+            df['Plik'] = file_name
+            if policy == 'flag':
+                df['Duplikat'] = is_duplicate
+            df_list.append(df)
+        except pd.errors.EmptyDataError:
+            pass
+
     if not df_list:
         return pd.DataFrame()
-        
+
     combined_df = pd.concat(df_list, ignore_index=True)
-    
+    combined_df['Plik'] = combined_df['Plik'].astype('category')
+
     return combined_df
 
-tab_HSC, tab_DMS, tab_OHIx, tab_Meta = st.tabs(["HSC", "DMS", "OHIx", "MetaCategories"])
+
+def load_survey_data(cache, data_root, survey_name, policy='first', scan=None):
+    """scan to wynik scan_survey_files, jeśli wywołujący już go ma."""
+    key = ('survey', str(data_root), survey_name, policy, folder_fingerprint(data_root / survey_name))
+
+    def read():
+        survey_scan = scan or scan_survey_files(cache, data_root, survey_name, policy)
+        return read_survey_data(data_root, survey_name, survey_scan, policy)
+
+    return cache.get_or_compute(key, read, frame_size)
+
+
+# --- KONFIGURACJA ANKIET ---
+SURVEY_CATEGORIES = {
+    'hsc': {
+        's1': 'Metody zarządzania',
+        's2': 'Portfolio produktów/usług',
+        's3': 'Pozycjonowanie firmy',
+        's4': 'Strategia'
+    },
+    'dms': {
+        's1': 'Infrastruktura Cyfrowa',
+        's2': 'Kultura Organizacyjna i Kompetencje Cyfrowe',
+        's3': 'Przewaga Technologiczna i Innowacyjność',
+        's4': 'Strategia Cyfrowa i Wizja',
+        's5': 'Zarządzanie Danymi'
+    },
+    'ohix': {
+        's1': 'Dobrostan i Rozwój Pracowników',
+        's2': 'Kultura i Wartości',
+        's3': 'Przywództwo i Wizja',
+        's4': 'Strategia i Koordynacja',
+        's5': 'Zaangażowanie i Współpraca w Zespole'
+    },
+}
+
+META_FORMULAS = {
+    'Strategia i Wizja': 'hsc_s1_1 * 0.2 + hsc_s1_2 * 0.4 + hsc_s1_3 * 0.3 + hsc_s1_4 * 0.2 + hsc_s1_5 * 0.5 + hsc_s2_1 * 0.6 + hsc_s2_2 * 0.5 + hsc_s2_3 * 0.5 + hsc_s2_4 * 0.7 + hsc_s2_5 * 0.4 + hsc_s4_1 * 0.4 + hsc_s4_3 * 0.3 + hsc_s4_4 * 0.4 + dms_s1_1 * 0.6 + dms_s1_2 * 0.6 + dms_s1_3 * 0.6 + dms_s1_4 * 0.5 + dms_s1_5 * 0.5 + dms_s2_4 * 0.3 + dms_s2_5 * 0.3 + dms_s3_1 * 0.3 + dms_s5_1 * 0.3 + ohix_s1_1 * 0.4 + ohix_s1_2 * 0.3 + ohix_s1_3 * 0.2 + ohix_s1_4 * 0.4 + ohix_s1_5 * 0.1 + ohix_s2_1 * 0.5 + ohix_s2_2 * 0.3 + ohix_s2_3 * 0.2 + ohix_s2_4 * 0.2 + ohix_s2_5 * 0.2 + ohix_s4_3 * 0.2 + ohix_s4_4 * 0.1 + ohix_s5_2 * 0.1',
+
+    'Pozycjonowanie Rynkowe': 'hsc_s1_1 * 0.8 + hsc_s1_2 * 0.6 + hsc_s1_3 * 0.7 + hsc_s1_4 * 0.5 + hsc_s1_5 * 0.5 + hsc_s2_1 * 0.4 + hsc_s3_2 * 0.3 + hsc_s3_3 * 0.2 + dms_s2_5 * 0.1 + ohix_s2_4 * 0.2',
+
+    'Portfolio (Produkty/Usługi)': 'hsc_s3_1 * 0.7 + hsc_s3_2 * 0.5 + hsc_s3_3 * 0.6 + hsc_s3_4 * 0.6 + hsc_s3_5 * 0.5 + dms_s2_2 * 0.2',
+
+    'Technologia i Innowacyjność': 'dms_s1_1 * 0.4 + dms_s1_2 * 0.4 + dms_s1_3 * 0.4 + dms_s1_4 * 0.5 + dms_s1_5 * 0.5 + dms_s2_1 * 0.6 + dms_s2_2 * 0.6 + dms_s2_3 * 0.6 + dms_s2_4 * 0.5 + dms_s2_5 * 0.4 + dms_s3_1 * 0.4 + dms_s3_3 * 0.3 + dms_s3_4 * 0.3 + dms_s4_1 * 0.3 + dms_s4_2 * 0.3 + dms_s4_3 * 0.4 + dms_s4_4 * 0.4 + dms_s4_5 * 0.5 + dms_s5_1 * 0.3 + dms_s5_2 * 0.3 + dms_s5_3 * 0.2 + dms_s5_4 * 0.3 + dms_s5_5 * 0.2',
+
+    'Dane i Analityka': 'hsc_s3_4 * 0.2 + hsc_s4_2 * 0.3 + dms_s3_1 * 0.7 + dms_s3_2 * 0.8 + dms_s3_3 * 0.7 + dms_s3_4 * 0.5 + dms_s3_5 * 0.7 + ohix_s4_4 * 0.2',
+
+    'Operacje i Procesy': 'hsc_s1_4 * 0.3 + hsc_s2_4 * 0.3 + hsc_s3_1 * 0.3 + hsc_s3_3 * 0.2 + hsc_s3_4 * 0.2 + hsc_s3_5 * 0.5 + hsc_s4_2 * 0.5 + dms_s2_1 * 0.4 + dms_s2_2 * 0.2 + dms_s3_2 * 0.2 + dms_s3_4 * 0.3 + dms_s5_1 * 0.4 + dms_s5_2 * 0.2 + ohix_s1_3 * 0.2 + ohix_s1_5 * 0.2 + ohix_s2_2 * 0.2 + ohix_s2_4 * 0.2 + ohix_s2_5 * 0.2 + ohix_s3_2 * 0.3 + ohix_s3_3 * 0.2 + ohix_s5_4 * 0.3 + ohix_s5_5 * 0.2',
+
+    'Infrastruktura i zasoby': 'dms_s2_4 * 0.2 + dms_s2_5 * 0.2 + dms_s3_5 * 0.3 + dms_s5_2 * 0.6 + dms_s5_3 * 0.8 + dms_s5_4 * 0.7 + dms_s5_5 * 0.8',
+
+    'Ludzie i Kultura Organizacyjna': 'hsc_s2_2 * 0.2 + hsc_s2_5 * 0.3 + hsc_s4_1 * 0.2 + hsc_s4_3 * 0.7 + hsc_s4_4 * 0.2 + hsc_s4_5 * 0.4 + dms_s2_3 * 0.5 + dms_s3_4 * 0.2 + dms_s4_1 * 0.7 + dms_s4_2 * 0.7 + dms_s4_3 * 0.6 + dms_s4_4 * 0.6 + dms_s4_5 * 0.5 + ohix_s1_1 * 0.3 + ohix_s1_2 * 0.3 + ohix_s1_3 * 0.3 + ohix_s1_4 * 0.2 + ohix_s2_1 * 0.2 + ohix_s2_2 * 0.2 + ohix_s3_1 * 0.5 + ohix_s3_2 * 0.3 + ohix_s3_3 * 0.3 + ohix_s3_4 * 0.4 + ohix_s3_5 * 0.5 + ohix_s4_1 * 0.7 + ohix_s4_2 * 0.6 + ohix_s4_3 * 0.5 + ohix_s4_4 * 0.4 + ohix_s4_5 * 0.5 + ohix_s5_1 * 0.6 + ohix_s5_2 * 0.5 + ohix_s5_3 * 0.7 + ohix_s5_4 * 0.5 + ohix_s5_5 * 0.4',
+
+    'Harmonia i Przywództwo': 'hsc_s2_3 * 0.5 + hsc_s3_2 * 0.2 + hsc_s4_2 * 0.2 + hsc_s4_5 * 0.6 + ohix_s1_1 * 0.3 + ohix_s1_2 * 0.4 + ohix_s1_3 * 0.4 + ohix_s1_4 * 0.4 + ohix_s1_5 * 0.3 + ohix_s2_1 * 0.3 + ohix_s2_2 * 0.5 + ohix_s2_3 * 0.4 + ohix_s2_4 * 0.4 + ohix_s2_5 * 0.4 + ohix_s3_1 * 0.5 + ohix_s3_2 * 0.4 + ohix_s3_3 * 0.5 + ohix_s3_4 * 0.3 + ohix_s3_5 * 0.5 + ohix_s4_1 * 0.3 + ohix_s4_2 * 0.2 + ohix_s4_3 * 0.3 + ohix_s4_4 * 0.3 + ohix_s4_5 * 0.5 + ohix_s5_1 * 0.4 + ohix_s5_2 * 0.4 + ohix_s5_3 * 0.3 + ohix_s5_4 * 0.5 + ohix_s5_5 * 0.4'
+}
+
+
+# --- AGREGATY ---
+def calc_nps(series):
+    promoters = (series >= 9).sum()
+    detractors = (series <= 6).sum()
+    total = len(series)
+    if total == 0: return 0
+    return ((promoters - detractors) / total) * 100
+
+
+def calc_box_stats(series):
+    """
+    Kwartyle i wąsy liczone tak jak w plotly.js (domyślna metoda 'linear'
+    w plotly to interpolacja w p*n - 0.5, czyli 'hazen' w numpy; wąsy do
+    1.5 * IQR), żeby boxplot dało się narysować bez surowych danych.
+    """
+    values = series.dropna()
+    q1, median, q3 = np.quantile(values.to_numpy(), [0.25, 0.5, 0.75], method='hazen').tolist()
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    outliers = values[(values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)]
+    return {
+        'q1': q1,
+        'median': median,
+        'q3': q3,
+        'lowerfence': float(inside.min()),
+        'upperfence': float(inside.max()),
+        'outliers': outliers.tolist(),
+    }
+
+
+def calc_category_scores(df, categories):
+    scores = pd.DataFrame(index=df.index)
+    for prefix, cat_name in categories.items():
+        cols = [col for col in df.columns if col.startswith(prefix)]
+        if cols:
+            scores[cat_name] = df[cols].mean(axis=1)
+    return scores
+
+
+def compute_survey_aggregates(df, categories):
+    question_cols = [col for col in df.columns if '-' in col]
+    lowest_3 = df[question_cols].mean().nsmallest(3)
+
+    scores = calc_category_scores(df, categories)
+    cat_cols = list(categories.values())
+
+    return {
+        'lowest_3': [[col_name, float(avg_score)] for col_name, avg_score in lowest_3.items()],
+        'categories': cat_cols,
+        'means': scores[cat_cols].mean().tolist(),
+        'mins': scores[cat_cols].min().tolist(),
+        'maxs': scores[cat_cols].max().tolist(),
+        'box': {cat: calc_box_stats(scores[cat]) for cat in cat_cols},
+        'nps': {cat: float(calc_nps(scores[cat])) for cat in cat_cols},
+    }
+
+
+def calculate_bounds(formula):
+    """
+    Analizuje formułę i oblicza wynik dla wszystkich zmiennych = 1 (min) oraz = 10 (max).
+    Zakłada format: prefix_sX_Y * waga
+    """
+    weights = re.findall(r'\*\s*([0-9.]+)', formula)
+    weights = [float(w) for w in weights]
+    
+    theo_min = sum(weights) * 1
+    theo_max = sum(weights) * 10
+    return theo_min, theo_max
+
+
+def build_combined_frame(survey_frames):
+    # Łączenie danych
+    min_len = min(len(df) for df in survey_frames.values())
+    df_combined = pd.DataFrame()
+
+    for prefix, df in survey_frames.items():
+        for col in df.columns:
+            if '-' in col:
+                clean_col = col.replace('-', '_')
+                df_combined[f"{prefix}_{clean_col}"] = df[col].iloc[:min_len].values
+
+    return df_combined
+
+
+def eval_meta_scores(df_combined):
+    """Wyniki metakategorii dla każdego respondenta oraz komunikaty o błędnych wzorach."""
+    scores = pd.DataFrame(index=df_combined.index)
+    errors = []
+
+    for cat_name, formula in META_FORMULAS.items():
+        try:
+            scores[cat_name] = df_combined.eval(formula)
+        except Exception as e:
+            errors.append(f"Sprawdź wzór dla '{cat_name}'. Błąd: {e}")
+
+    return scores, errors
+
+
+def compute_meta_stats(df_combined):
+    stats_list = []
+    scores, errors = eval_meta_scores(df_combined)
+
+    for cat_name in scores.columns:
+        real_scores = scores[cat_name]
+
+        # Teoretyczne min/max dla szarego tła
+        theo_min, theo_max = calculate_bounds(META_FORMULAS[cat_name])
+
+        stats_list.append({
+            'Kategoria': cat_name,
+            'Theo Min': theo_min,
+            'Wartość minimalna': float(real_scores.min()),
+            'Q1': float(real_scores.quantile(0.25)),
+            'Mediana': float(real_scores.median()),
+            'Średnia': float(real_scores.mean()),
+            'Q3': float(real_scores.quantile(0.75)),
+            'Wartość maksymalna': float(real_scores.max()),
+            'Theo Max': theo_max
+        })
+
+    return {'stats': stats_list, 'errors': errors}
+
+
+def compute_all_aggregates(cache, data_root, policy):
+    """
+    Liczy wszystko, co wyświetlają cztery panele. Wspólny cache przekazywany
+    jest jawnie i nic tu nie wywołuje funkcji st.* (także st.cache_resource),
+    więc może działać w wątku w tle.
+    """
+    aggregates = {'duplicates': {}}
+    survey_frames = {}
+
+    for survey_name, categories in SURVEY_CATEGORIES.items():
+        scan = scan_survey_files(cache, data_root, survey_name, policy)
+        aggregates['duplicates'][survey_name] = scan[1]
+
+        df = load_survey_data(cache, data_root, survey_name, policy, scan)
+        survey_frames[survey_name] = df
+        aggregates[survey_name] = None if df.empty else compute_survey_aggregates(df, categories)
+
+    if any(df.empty for df in survey_frames.values()):
+        aggregates['meta'] = None
+    else:
+        aggregates['meta'] = compute_meta_stats(build_combined_frame(survey_frames))
+
+    return aggregates
+
+
+# --- SNAPSHOTY ---
+SNAPSHOT_PATH = Path(".cache") / "snapshots.sqlite"
+# Podbijać tylko przy zmianie funkcji compute_* lub kształtu agregatów.
+AGGREGATES_SCHEMA_VERSION = 1
+# Wersja kodu wykresów dla cache w pamięci procesu (nie dla snapshotów).
+CODE_VERSION = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:16]
+
+
+class SnapshotStore:
+    """
+    Zapisane na dysku agregaty, kluczowane odciskiem danych i wersją schematu
+    agregatów (nie wersją pliku), więc snapshot przeżywa zwykły deploy.
+    Dla każdego zakresu (scope) trzymany jest tylko najnowszy snapshot.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._failures = {}
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS aggregate_snapshots ("
+                "scope TEXT, fingerprint TEXT, schema_version INTEGER, created REAL, payload TEXT, "
+                "PRIMARY KEY (scope, fingerprint, schema_version))"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def read(self, scope, schema_version, fingerprint=None):
+        query = "SELECT payload FROM aggregate_snapshots WHERE scope = ? AND schema_version = ?"
+        params = [scope, schema_version]
+        if fingerprint is not None:
+            query += " AND fingerprint = ?"
+            params.append(fingerprint)
+        query += " ORDER BY created DESC LIMIT 1"
+
+        with closing(self._connect()) as conn:
+            row = conn.execute(query, params).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def write(self, scope, fingerprint, schema_version, payload):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM aggregate_snapshots WHERE scope = ?", (scope,))
+            conn.execute(
+                "INSERT INTO aggregate_snapshots VALUES (?, ?, ?, ?, ?)",
+                (scope, fingerprint, schema_version, time.time(), json.dumps(payload)),
+            )
+
+    def failure(self, scope):
+        """Błąd ostatniego przeliczenia w tle dla danego zakresu albo None."""
+        with self._lock:
+            failure = self._failures.get(scope)
+        return failure[1] if failure else None
+
+    def revalidate(self, scope, fingerprint, schema_version, compute):
+        key = (scope, fingerprint)
+        with self._lock:
+            # ten sam odcisk danych już raz się nie przeliczył - nie ponawiamy
+            failure = self._failures.get(scope)
+            if key in self._pending or (failure and failure[0] == fingerprint):
+                return
+            self._pending.add(key)
+
+        def run():
+            try:
+                self.write(scope, fingerprint, schema_version, compute())
+                with self._lock:
+                    self._failures.pop(scope, None)
+            except Exception as e:
+                with self._lock:
+                    self._failures[scope] = (fingerprint, f"{type(e).__name__}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+@st.cache_resource
+def get_snapshot_store():
+    return SnapshotStore(SNAPSHOT_PATH)
+
+
+# --- BENCHMARK ---
+BENCHMARK_BINS = 100
+# Benchmark zawsze liczony przy tej samej polityce duplikatów, żeby rozkład
+# nie mieszał wyników 'flag' (z duplikatami) z 'first'/'latest'.
+BENCHMARK_POLICY = 'first'
+CATEGORY_SCORE_RANGE = (0, 10)
+
+
+def benchmark_axes(aggregates):
+    """
+    Wyniki klienta dla każdej osi porównania: {oś: (wynik, min skali, max skali)}.
+    Osie to kategorie ankiet ('hsc/Strategia') i metakategorie ('meta/Dane i Analityka').
+    """
+    axes = {}
+    for survey_name in SURVEY_CATEGORIES:
+        agg = aggregates[survey_name]
+        if agg is None:
+            continue
+        for cat, mean in zip(agg['categories'], agg['means']):
+            axes[f"{survey_name}/{cat}"] = (mean, *CATEGORY_SCORE_RANGE)
+    if aggregates['meta'] is not None:
+        for row in aggregates['meta']['stats']:
+            axes[f"meta/{row['Kategoria']}"] = (row['Średnia'], row['Theo Min'], row['Theo Max'])
+    return axes
+
+
+def histogram_bin(score, lo, hi):
+    position = int((score - lo) / (hi - lo) * BENCHMARK_BINS)
+    return min(max(position, 0), BENCHMARK_BINS - 1)
+
+
+class BenchmarkStore:
+    """
+    Rozkłady wyników wszystkich klientów dla każdej osi, trzymane jako
+    histogramy z sumami prefiksowymi, więc percentyl to odczyt O(1).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._histograms = None
+        self.rebuilding = False
+        self.rebuild_error = None
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS benchmark_scores ("
+                "client TEXT, axis TEXT, score REAL, lo REAL, hi REAL, "
+                "PRIMARY KEY (client, axis))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS benchmark_histograms ("
+                "axis TEXT PRIMARY KEY, lo REAL, hi REAL, counts TEXT)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record(self, client, aggregates):
+        self.record_many({client: aggregates})
+
+    def record_many(self, aggregates_by_client):
+        """Zapisuje wyniki klientów (policzone przy BENCHMARK_POLICY) i raz przebudowuje histogramy."""
+        with closing(self._connect()) as conn, conn:
+            for client, aggregates in aggregates_by_client.items():
+                rows = [
+                    (client, axis, score, lo, hi)
+                    for axis, (score, lo, hi) in benchmark_axes(aggregates).items()
+                    if not math.isnan(score) and hi > lo
+                ]
+                conn.execute("DELETE FROM benchmark_scores WHERE client = ?", (client,))
+                conn.executemany("INSERT INTO benchmark_scores VALUES (?, ?, ?, ?, ?)", rows)
+            self._rebuild_histograms(conn)
+        with self._lock:
+            self._histograms = None
+
+    def rebuild_in_background(self, cache, data_roots):
+        """
+        Przelicza wszystkich klientów przy BENCHMARK_POLICY w wątku w tle.
+        Surowe dane czytane są z pominięciem wspólnego cache.
+        """
+        with self._lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+            self.rebuild_error = None
+
+        def run():
+            try:
+                uncached = PassThroughCache(cache)
+                self.record_many({
+                    str(root): compute_all_aggregates(uncached, root, BENCHMARK_POLICY)
+                    for root in data_roots
+                })
+            except Exception as e:
+                self.rebuild_error = f"{type(e).__name__}: {e}"
+            finally:
+                with self._lock:
+                    self.rebuilding = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _rebuild_histograms(self, conn):
+        histograms = {}
+        for axis, score, lo, hi in conn.execute("SELECT axis, score, lo, hi FROM benchmark_scores"):
+            counts = histograms.setdefault(axis, (lo, hi, [0] * BENCHMARK_BINS))[2]
+            counts[histogram_bin(score, lo, hi)] += 1
+        conn.execute("DELETE FROM benchmark_histograms")
+        conn.executemany(
+            "INSERT INTO benchmark_histograms VALUES (?, ?, ?, ?)",
+            [(axis, lo, hi, json.dumps(counts)) for axis, (lo, hi, counts) in histograms.items()],
+        )
+
+    def _load_histograms(self):
+        with self._lock:
+            if self._histograms is None:
+                histograms = {}
+                with closing(self._connect()) as conn:
+                    for axis, lo, hi, counts in conn.execute("SELECT * FROM benchmark_histograms"):
+                        counts = json.loads(counts)
+                        below = [0]
+                        for count in counts:
+                            below.append(below[-1] + count)
+                        histograms[axis] = (lo, hi, counts, below)
+                self._histograms = histograms
+            return self._histograms
+
+    def client_scores(self, client):
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT axis, score FROM benchmark_scores WHERE client = ?", (client,))
+            return dict(rows.fetchall())
+
+    def percentile_rank(self, axis, score, own_score=None):
+        """
+        Percentyl wyniku na tle pozostałych klientów. Własny, zapisany wynik
+        klienta (own_score) jest odejmowany od rozkładu. Zwraca None, gdy nie
+        ma z kim porównać.
+        """
+        histogram = self._load_histograms().get(axis)
+        if histogram is None or math.isnan(score):
+            return None
+        lo, hi, counts, below = histogram
+
+        position = histogram_bin(score, lo, hi)
+        n_below, n_same, total = below[position], counts[position], below[-1]
+        if own_score is not None:
+            own_position = histogram_bin(own_score, lo, hi)
+            if own_position < position:
+                n_below -= 1
+            elif own_position == position:
+                n_same -= 1
+            total -= 1
+
+        if total <= 0:
+            return None
+        return (n_below + 0.5 * n_same) / total * 100
+
+
+@st.cache_resource
+def get_benchmark_store():
+    return BenchmarkStore(SNAPSHOT_PATH)
+
+
+def data_fingerprint(data_root, policy):
+    digest = hashlib.sha256(policy.encode())
+    for survey_name in SURVEY_CATEGORIES:
+        digest.update(f"{survey_name}:{folder_fingerprint(data_root / survey_name)}".encode())
+    return digest.hexdigest()
+
+
+def snapshot_scope(data_root, policy):
+    return f"{data_root}|{policy}"
+
+
+def load_aggregates(data_root, policy):
+    """
+    Zwraca (agregaty, czy_nieaktualne). Snapshot pasujący do odcisku danych
+    podawany jest od razu; najnowszy snapshot z tą samą wersją schematu też
+    (np. po deployu albo dopisaniu plików), ale wtedy w tle liczony jest nowy. Dopiero gdy nie ma żadnego, agregaty liczone są synchronicznie.
+    """
+    store = get_snapshot_store()
+    cache = get_shared_cache()
+    benchmarks = get_benchmark_store()
+    scope = snapshot_scope(data_root, policy)
+    fingerprint = data_fingerprint(data_root, policy)
+    key = ('aggregates', scope, fingerprint, AGGREGATES_SCHEMA_VERSION)
+
+    def compute():
+        aggregates = compute_all_aggregates(cache, data_root, policy)
+        if policy == BENCHMARK_POLICY:
+            benchmarks.record(str(data_root), aggregates)
+        return aggregates
+
+    aggregates = cache.get(key)
+    if aggregates is not None:
+        return aggregates, False
+
+    aggregates = store.read(scope, AGGREGATES_SCHEMA_VERSION, fingerprint)
+    if aggregates is not None:
+        cache.put(key, aggregates, payload_size(aggregates))
+        return aggregates, False
+
+    aggregates = store.read(scope, AGGREGATES_SCHEMA_VERSION)
+    if aggregates is not None:
+        store.revalidate(scope, fingerprint, AGGREGATES_SCHEMA_VERSION, compute)
+        return aggregates, True
+
+    aggregates = compute()
+    store.write(scope, fingerprint, AGGREGATES_SCHEMA_VERSION, aggregates)
+    cache.put(key, aggregates, payload_size(aggregates))
+    return aggregates, False
+
+
+# --- RESPONDENCI ---
+class RespondentIndex:
+    """
+    Odpowiedzi respondentów wraz z wynikami na każdej osi i gotowymi
+    indeksami sortowania (argsort), więc top/bottom-k i kolejne strony
+    to tylko wycinek tablicy pozycji.
+    """
+
+    def __init__(self, answers, scores, errors=()):
+        self.answers = answers
+        self.scores = scores
+        self.errors = list(errors)
+        self._order = {}
+        self._valid = {}
+        for axis in scores.columns:
+            values = scores[axis].to_numpy(dtype=float)
+            # argsort układa NaN na końcu, więc pierwsze _valid pozycji to wyniki
+            self._order[axis] = np.argsort(values, kind='stable')
+            self._valid[axis] = int((~np.isnan(values)).sum())
+
+    @property
+    def nbytes(self):
+        return frame_size(self.answers) + frame_size(self.scores) + sum(order.nbytes for order in self._order.values())
+
+    def count(self, axis):
+        return self._valid[axis]
+
+    def page(self, axis, ascending, page, page_size):
+        order = self._order[axis][:self._valid[axis]]
+        if not ascending:
+            order = order[::-1]
+        positions = order[page * page_size:(page + 1) * page_size]
+
+        rows = self.answers.iloc[positions].copy()
+        rows.insert(0, axis, self.scores[axis].to_numpy()[positions])
+        return rows
+
+
+def build_respondent_indexes(cache, data_root, policy):
+    survey_frames = {name: load_survey_data(cache, data_root, name, policy) for name in SURVEY_CATEGORIES}
+
+    indexes = {}
+    for survey_name, categories in SURVEY_CATEGORIES.items():
+        df = survey_frames[survey_name]
+        if not df.empty:
+            indexes[survey_name] = RespondentIndex(df, calc_category_scores(df, categories))
+
+    if not any(df.empty for df in survey_frames.values()):
+        df_combined = build_combined_frame(survey_frames)
+        scores, errors = eval_meta_scores(df_combined)
+        # pliki źródłowe z każdej ankiety, żeby wiersz dało się przypisać respondentom
+        sources = pd.DataFrame({
+            f"{prefix}_Plik": df['Plik'].iloc[:len(df_combined)].to_numpy()
+            for prefix, df in survey_frames.items()
+        }, index=df_combined.index)
+        answers = pd.concat([sources, df_combined], axis=1)
+        indexes['meta'] = RespondentIndex(answers, scores, errors)
+
+    return indexes
+
+
+def load_respondent_indexes(data_root, policy):
+    key = ('respondents', str(data_root), policy, data_fingerprint(data_root, policy))
+    cache = get_shared_cache()
+    return cache.get_or_compute(
+        key,
+        lambda: build_respondent_indexes(cache, data_root, policy),
+        lambda indexes: sum(index.nbytes for index in indexes.values()),
+    )
+
+
+# --- WYKRESY ---
+def build_radar_figure(agg):
+    cat_cols = agg['categories']
+    means, mins, maxs = agg['means'], agg['mins'], agg['maxs']
+
+    radar_cats = cat_cols + [cat_cols[0]]
+    radar_means = means + [means[0]]
+    radar_mins = mins + [mins[0]]
+    radar_maxs = maxs + [maxs[0]]
+
+    fig_radar = go.Figure()
+
+    fig_radar.add_trace(go.Scatterpolar(
+        r=radar_maxs, theta=radar_cats, mode='lines+markers', marker=dict(size=5),
+        line=dict(color='#ff4b4b', dash='dash', width=1.5), name='Maksymalna'
+    ))
+    fig_radar.add_trace(go.Scatterpolar(
+        r=radar_mins, theta=radar_cats, mode='lines+markers', marker=dict(size=5),
+        line=dict(color='#ff7f0e', dash='dash', width=1.5), name='Minimalna'
+    ))
+    fig_radar.add_trace(go.Scatterpolar(
+        r=radar_means, theta=radar_cats, fill='toself',
+        fillcolor='rgba(245, 166, 35, 0.4)', 
+        line=dict(color='#f5a623', width=2), name='Średnia'
+    ))
+
+    fig_radar.update_layout(
+        polar=dict(radialaxis=dict(visible=True, range=[0, 10])),
+        showlegend=True,
+        legend=dict(yanchor="bottom", y=-0.3, xanchor="left", x=0),
+        margin=dict(l=40, r=40, t=20, b=20)
+    )
+    return fig_radar
+
+
+def build_box_figure(agg, colors):
+    fig_box = go.Figure()
+
+    for cat, color in zip(agg['categories'], colors):
+        stats = agg['box'][cat]
+        fig_box.add_trace(go.Box(
+            x=[cat], q1=[stats['q1']], median=[stats['median']], q3=[stats['q3']],
+            lowerfence=[stats['lowerfence']], upperfence=[stats['upperfence']],
+            name=cat, marker_color=color
+        ))
+        if stats['outliers']:
+            fig_box.add_trace(go.Scatter(
+                x=[cat] * len(stats['outliers']), y=stats['outliers'], mode='markers',
+                marker=dict(color=color), name=cat, hoverinfo='y'
+            ))
+
+    fig_box.update_layout(
+        showlegend=False, 
+        boxmode='overlay',
+        xaxis_title=None, 
+        yaxis=dict(range=[0, 10.5]),
+        margin=dict(l=20, r=20, t=20, b=20)
+    )
+    return fig_box
+
+
+def build_nps_figure(agg, color_map):
+    df_nps = pd.DataFrame(list(agg['nps'].items()), columns=['Kategoria', 'NPS']).sort_values('NPS')
+    df_nps['Color'] = df_nps['Kategoria'].map(color_map)
+
+    fig_nps = go.Figure(go.Bar(
+        x=df_nps['Kategoria'],
+        y=df_nps['NPS'],
+        marker_color=df_nps['Color'],
+        text=[f"{val:.1f}%" for val in df_nps['NPS']],
+        textposition='outside'
+    ))
+
+    fig_nps.update_layout(
+        title=dict(text="NPS dla każdej kategorii DMS", x=0.5),
+        yaxis=dict(range=[-100, 100], title="NPS (%)", zeroline=True, zerolinecolor='black'),
+        xaxis=dict(title="Kategoria"),
+        showlegend=False,
+        margin=dict(l=40, r=40, t=40, b=40)
+    )
+    return fig_nps
+
+
+def build_meta_figure(stats):
+    df_stats = pd.DataFrame(stats)
+    fig_meta = go.Figure()
+
+    for index, row in df_stats[::-1].iterrows():
+        # 1. Szare tło: Teoretyczne MIN do Teoretyczne MAX
+        fig_meta.add_trace(go.Scatter(
+            x=[row['Theo Min'], row['Theo Max']],
+            y=[row['Kategoria'], row['Kategoria']],
+            mode='lines',
+            line=dict(color='#E0E0E0', width=20),
+            hoverinfo='text',
+            hovertext=f"Zakres teoretyczny: {row['Theo Min']:.1f} - {row['Theo Max']:.1f}"
+        ))
+        
+        # 2. Czarna "świeca": Realne MIN do Realne MAX
+        fig_meta.add_trace(go.Scatter(
+            x=[row['Wartość minimalna'], row['Wartość maksymalna']],
+            y=[row['Kategoria'], row['Kategoria']],
+            mode='lines+markers',
+            line=dict(color='black', width=4),
+            marker=dict(color='black', size=8),
+            hoverinfo='text',
+            hovertext=f"Realny rozrzut z ankiet: {row['Wartość minimalna']:.1f} - {row['Wartość maksymalna']:.1f}"
+        ))
+        
+        # 3. Niebieska kropka - Średnia
+        fig_meta.add_trace(go.Scatter(
+            x=[row['Średnia']],
+            y=[row['Kategoria']],
+            mode='markers+text',
+            marker=dict(color='blue', size=8),
+            text=[f"{row['Średnia']:.1f}"],
+            textposition='bottom center',
+            textfont=dict(color='blue', size=10)
+        ))
+
+    fig_meta.update_layout(
+        showlegend=False,
+        height=500,
+        margin=dict(l=20, r=20, t=20, b=20),
+        xaxis=dict(gridcolor='lightgray', showline=True, linecolor='black'),
+        yaxis=dict(gridcolor='lightgray'),
+        plot_bgcolor='white'
+    )
+    return fig_meta
+
+
+FIGURE_BASE_BYTES = 64 * 1024
+
+
+class FigureStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.build_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, hit, seconds=0.0):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self.build_seconds += seconds
+
+
+@st.cache_resource
+def get_figure_stats():
+    return FigureStats()
+
+
+def cached_figure(build, *inputs):
+    """
+    Buduje wykres tylko wtedy, gdy zmieniły się jego dane wejściowe (agregaty,
+    kolory) albo motyw. Gotowy go.Figure trafia do wspólnego cache; st.plotly_chart
+    serializuje go wtedy bez ponownej walidacji, której wymagałby słownik ze specyfikacją.
+    """
+    spec_inputs = json.dumps([build.__name__, inputs, st.get_option("theme.base"), CODE_VERSION], sort_keys=True)
+    key = ('figure', hashlib.sha256(spec_inputs.encode()).hexdigest())
+    cache = get_shared_cache()
+    stats = get_figure_stats()
+
+    figure = cache.get(key)
+    if figure is not None:
+        stats.record(hit=True)
+        return figure
+
+    start = time.perf_counter()
+    figure = build(*inputs)
+    stats.record(hit=False, seconds=time.perf_counter() - start)
+    # Szacunek rozmiaru bez serializacji wykresu: dane wejściowe plus stały narzut obiektu.
+    cache.put(key, figure, len(spec_inputs) + FIGURE_BASE_BYTES)
+    return figure
+
+
+def read_analysis_text(client, data_root):
+    analysis_dir = Path("analysis") if client == DEFAULT_CLIENT else data_root / "analysis"
+    analysis_path = analysis_dir / "dms.txt"
+    if analysis_path.exists():
+        with open(analysis_path, "r", encoding="utf-8") as f:
+            return f.read()
+    return f"**Brak pliku:** Utwórz plik `{analysis_path.as_posix()}`, aby wyświetlić tutaj wnioski."
+
+
+def show_benchmark_ranks(benchmarks, own_scores, survey_name, agg):
+    ranks = {}
+    for cat, mean in zip(agg['categories'], agg['means']):
+        axis = f"{survey_name}/{cat}"
+        ranks[cat] = benchmarks.percentile_rank(axis, mean, own_scores.get(axis))
+
+    if all(rank is None for rank in ranks.values()):
+        st.caption("Brak danych porównawczych z innych klientów.")
+        return
+
+    st.markdown("#### 📊 Percentyl na tle pozostałych klientów")
+    for column, (cat, rank) in zip(st.columns(len(ranks)), ranks.items()):
+        column.metric(cat, "–" if rank is None else f"{rank:.0f}")
+
+
+DRILLDOWN_PAGE_SIZES = [10, 25, 50, 100]
+
+
+def radar_selection(event, categories):
+    """Kliknięty punkt na radarze -> (kategoria, rosnąco) albo None."""
+    for point in event.selection.points:
+        # ostatni punkt radaru domyka wykres i powtarza pierwszą kategorię
+        cat = categories[point['point_index'] % len(categories)]
+        if point['curve_number'] == 0:  # Maksymalna
+            return cat, False
+        if point['curve_number'] == 1:  # Minimalna
+            return cat, True
+    return None
+
+
+def meta_selection(event, df_stats):
+    """Kliknięty koniec świecy na wykresie metakategorii -> (kategoria, rosnąco) albo None."""
+    row_names = df_stats['Kategoria'][::-1].tolist()
+    for point in event.selection.points:
+        # każdy wiersz to 3 ślady: tło, świeca, średnia
+        row, trace = divmod(point['curve_number'], 3)
+        if trace == 1:
+            return row_names[row], point['point_index'] == 0
+    return None
+
+
+def show_respondent_page(index, axis, ascending, key):
+    n_rows = index.count(axis)
+    col_size, col_page = st.columns(2)
+    page_size = col_size.selectbox("Wierszy na stronę", DRILLDOWN_PAGE_SIZES, key=f"{key}_size")
+    n_pages = max(1, math.ceil(n_rows / page_size))
+    page_key = f"{key}_page"
+    if page_key not in st.session_state or st.session_state[page_key] > n_pages:
+        st.session_state[page_key] = 1
+    page = col_page.number_input(f"Strona (z {n_pages})", min_value=1, max_value=n_pages, key=page_key)
+
+    st.dataframe(index.page(axis, ascending, page - 1, page_size), use_container_width=True)
+    st.caption(f"Respondentów z wynikiem: {n_rows}")
+
+
+def show_extreme_respondents(selection, client, data_root, policy, panel):
+    if selection is None:
+        return
+    axis, ascending = selection
+    index = load_respondent_indexes(data_root, policy).get(panel)
+    if index is None or axis not in index.scores.columns:
+        return
+
+    label = "najniższe" if ascending else "najwyższe"
+    st.markdown(f"#### 🔎 Respondenci – {label} wyniki: {axis}")
+    show_respondent_page(index, axis, ascending, key=f"drill_{client}_{panel}")
+
+
+def show_duplicates_info(duplicates, policy):
+    if not duplicates:
+        return
+    if policy == 'flag':
+        st.warning(f"Wykryto duplikaty ({len(duplicates)}) – uwzględnione w wynikach, oznaczone w kolumnie 'Duplikat'.")
+    else:
+        st.info(f"Pominięto duplikaty ({len(duplicates)}).")
+    with st.expander("Pliki uznane za duplikaty"):
+        st.write(duplicates)
+
+
+data_roots, rejected_roots = list_data_roots()
+for folder in rejected_roots:
+    st.sidebar.warning(f"Pominięto `{folder.as_posix()}`: nazwa zajęta przez klienta domyślnego (data/).")
+if not data_roots:
+    st.error(f"Brak danych: utwórz folder `data/` albo `{CLIENTS_ROOT.as_posix()}/<klient>/`.")
+    st.stop()
+
+client_names = list(data_roots)
+requested_client = st.query_params.get("client", DEFAULT_CLIENT)
+client = st.sidebar.selectbox(
+    "Klient",
+    options=client_names,
+    index=client_names.index(requested_client) if requested_client in client_names else 0,
+)
+st.query_params["client"] = client
+data_root = data_roots[client]
+
+dedup_policy = st.sidebar.selectbox(
+    "Duplikaty zgłoszeń",
+    options=list(DEDUP_POLICIES),
+    format_func=DEDUP_POLICIES.get,
+)
+
+aggregates, aggregates_stale = load_aggregates(data_root, dedup_policy)
+if aggregates_stale:
+    revalidation_error = get_snapshot_store().failure(snapshot_scope(data_root, dedup_policy))
+    if revalidation_error:
+        st.sidebar.error(
+            "Wyświetlany jest ostatni zapisany snapshot – nie udało się przeliczyć aktualnych wyników: "
+            f"{revalidation_error}"
+        )
+    else:
+        st.sidebar.info("Wyświetlany jest ostatni zapisany snapshot – aktualne wyniki są liczone w tle.")
+        if st.sidebar.button("Odśwież"):
+            st.rerun()
+
+benchmark_store = get_benchmark_store()
+benchmark_own_scores = benchmark_store.client_scores(str(data_root))
+with st.sidebar.expander("Benchmark"):
+    st.caption("Wyniki wszystkich klientów, z którymi porównywane są percentyle "
+               f"(liczone zawsze przy polityce: {DEDUP_POLICIES[BENCHMARK_POLICY]}).")
+    if st.button("Przelicz dla wszystkich klientów", disabled=benchmark_store.rebuilding):
+        benchmark_store.rebuild_in_background(get_shared_cache(), list(data_roots.values()))
+    if benchmark_store.rebuilding:
+        st.info("Benchmark jest przeliczany w tle – odśwież stronę za chwilę.")
+    elif benchmark_store.rebuild_error:
+        st.error(f"Nie udało się przeliczyć benchmarku: {benchmark_store.rebuild_error}")
+
+# wypełniane na końcu skryptu, po zbudowaniu wszystkich wykresów
+cache_caption = st.sidebar.empty()
+
+tab_HSC, tab_DMS, tab_OHIx, tab_Meta, tab_Respondents = st.tabs(["HSC", "DMS", "OHIx", "MetaCategories", "Respondenci"])
 
 # ==========================================
 # HSC TAB
 # ==========================================
 with tab_HSC:
     st.title("Panel 1: HSC")
-    df_hsc = load_survey_data("hsc")
+    show_duplicates_info(aggregates['duplicates']['hsc'], dedup_policy)
+    agg_hsc = aggregates['hsc']
     
-    if df_hsc.empty:
+    if agg_hsc is None:
         st.warning("No HSC data available.")
     else:
-
         # --- 0. TRZY PYTANIA Z NAJNIŻSZĄ ŚREDNIĄ ---
-        question_cols = [col for col in df_hsc.columns if '-' in col]
-        lowest_3 = df_hsc[question_cols].mean().nsmallest(3)
-
         question_dict = {
             's1-1': 'Nasza firma jasno określa, w czym jest lepsza od konkurencji.',
             's1-2': 'Decyzje strategiczne opieramy na głębokim zrozumieniu naszego rynku i jego trendów.',
@@ -79,124 +1277,41 @@ with tab_HSC:
         st.markdown("### 📉 Pytania z najniższą średnią:")
         st.write("") 
 
-        for i, (col_name, avg_score) in enumerate(lowest_3.items()):
+        for i, (col_name, avg_score) in enumerate(agg_hsc['lowest_3']):
             question = question_dict.get(col_name, col_name)
             st.markdown(f"**„{question}”**")
-            opis = st.text_area(f"👉 Średnia: {avg_score:.2f}", key=f"desc_hsc_{col_name}")
-        
+            st.text_area(f"👉 Średnia: {avg_score:.2f}", key=f"desc_{client}_hsc_{col_name}")
+
         st.divider() 
 
         # --- 1. RADAR I BOXPLOT ---
-        categories = {
-            's1': 'Metody zarządzania',
-            's2': 'Portfolio produktów/usług',
-            's3': 'Pozycjonowanie firmy',
-            's4': 'Strategia'
-        }
-
-        for prefix, cat_name in categories.items():
-            cols = [col for col in df_hsc.columns if col.startswith(prefix)]
-            if cols:
-                df_hsc[cat_name] = df_hsc[cols].mean(axis=1)
-        
-        cat_cols = list(categories.values())
-
-        means = df_hsc[cat_cols].mean().tolist()
-        mins = df_hsc[cat_cols].min().tolist()
-        maxs = df_hsc[cat_cols].max().tolist()
-
-        radar_cats = cat_cols + [cat_cols[0]]
-        radar_means = means + [means[0]]
-        radar_mins = mins + [mins[0]]
-        radar_maxs = maxs + [maxs[0]]
-
-        fig_radar = go.Figure()
-
-        fig_radar.add_trace(go.Scatterpolar(
-            r=radar_maxs, theta=radar_cats, mode='lines',
-            line=dict(color='#ff4b4b', dash='dash', width=1.5), name='Maksymalna'
-        ))
-        fig_radar.add_trace(go.Scatterpolar(
-            r=radar_mins, theta=radar_cats, mode='lines',
-            line=dict(color='#ff7f0e', dash='dash', width=1.5), name='Minimalna'
-        ))
-        fig_radar.add_trace(go.Scatterpolar(
-            r=radar_means, theta=radar_cats, fill='toself',
-            fillcolor='rgba(245, 166, 35, 0.4)', 
-            line=dict(color='#f5a623', width=2), name='Średnia'
-        ))
-
-        fig_radar.update_layout(
-            polar=dict(radialaxis=dict(visible=True, range=[0, 10])),
-            showlegend=True,
-            legend=dict(yanchor="bottom", y=-0.3, xanchor="left", x=0),
-            margin=dict(l=40, r=40, t=20, b=20)
-        )
-
-        df_melted = df_hsc.melt(value_vars=cat_cols, var_name='Kategoria', value_name='Ocena')
-
-        fig_box = px.box(
-            df_melted, x='Kategoria', y='Ocena', color='Kategoria',
-            color_discrete_sequence=['#E39B20', '#D46A40', '#D8445F', '#DE68B5'] 
-        )
-
-        fig_box.update_layout(
-            showlegend=False, 
-            xaxis_title=None, 
-            yaxis=dict(range=[0, 10.5]),
-            margin=dict(l=20, r=20, t=20, b=20)
-        )
+        fig_radar = cached_figure(build_radar_figure, agg_hsc)
+        fig_box = cached_figure(build_box_figure, agg_hsc, ['#E39B20', '#D46A40', '#D8445F', '#DE68B5'])
 
         col_left, col_right = st.columns(2)
 
         with col_left:
-            st.plotly_chart(fig_radar, use_container_width=True)
+            radar_event = st.plotly_chart(
+                fig_radar, use_container_width=True,
+                on_select="rerun", selection_mode="points", key=f"radar_{client}_hsc"
+            )
 
         with col_right:
             st.plotly_chart(fig_box, use_container_width=True)
 
-        # --- 2. NPS I ANALIZA ---
-        def calc_nps(series):
-            promoters = (series >= 9).sum()
-            detractors = (series <= 6).sum()
-            total = len(series)
-            if total == 0: return 0
-            return ((promoters - detractors) / total) * 100
-
-        nps_data = {cat: calc_nps(df_hsc[cat]) for cat in cat_cols}
-        
-        df_nps = pd.DataFrame(list(nps_data.items()), columns=['Kategoria', 'NPS']).sort_values('NPS')
+        show_benchmark_ranks(benchmark_store, benchmark_own_scores, 'hsc', agg_hsc)
+        show_extreme_respondents(radar_selection(radar_event, agg_hsc['categories']), client, data_root, dedup_policy, 'hsc')
 
+        # --- 2. NPS I ANALIZA ---
         color_map = {
             'Metody zarządzania': '#E39B20', 
             'Portfolio produktów/usług': '#D46A40', 
             'Pozycjonowanie firmy': '#D8445F', 
             'Strategia': '#DE68B5'
         }
-        df_nps['Color'] = df_nps['Kategoria'].map(color_map)
-
-        fig_nps = go.Figure(go.Bar(
-            x=df_nps['Kategoria'],
-            y=df_nps['NPS'],
-            marker_color=df_nps['Color'],
-            text=[f"{val:.1f}%" for val in df_nps['NPS']],
-            textposition='outside'
-        ))
-
-        fig_nps.update_layout(
-            title=dict(text="NPS dla każdej kategorii DMS", x=0.5),
-            yaxis=dict(range=[-100, 100], title="NPS (%)", zeroline=True, zerolinecolor='black'),
-            xaxis=dict(title="Kategoria"),
-            showlegend=False,
-            margin=dict(l=40, r=40, t=40, b=40)
-        )
+        fig_nps = cached_figure(build_nps_figure, agg_hsc, color_map)
 
-        analysis_path = Path("analysis") / "dms.txt"
-        if analysis_path.exists():
-            with open(analysis_path, "r", encoding="utf-8") as f:
-                analysis_text = f.read()
-        else:
-            analysis_text = "**Brak pliku:** Utwórz plik `analysis/dms.txt`, aby wyświetlić tutaj wnioski."
+        analysis_text = read_analysis_text(client, data_root)
 
         st.write("---")
         
@@ -208,19 +1323,19 @@ with tab_HSC:
         with col_text_right:
             st.markdown(analysis_text)
 
+
 # ==========================================
 # DMS TAB
 # ==========================================
 with tab_DMS:
     st.title("Panel 2: DMS")
-    df_dms = load_survey_data("dms")
-    if df_dms.empty:
+    show_duplicates_info(aggregates['duplicates']['dms'], dedup_policy)
+    agg_dms = aggregates['dms']
+    
+    if agg_dms is None:
         st.warning("No DMS data available.")
     else:
         # --- 0. TRZY PYTANIA Z NAJNIŻSZĄ ŚREDNIĄ ---
-        question_cols = [col for col in df_dms.columns if '-' in col]
-        lowest_3 = df_dms[question_cols].mean().nsmallest(3)
-
         question_dict = {
             's1-1': 'Organizacja posiada jasno określoną strategię cyfrową zgodną z jej długoterminowymi celami biznesowymi.',
             's1-2': 'Strategia cyfrowa organizacji jest jasno i konsekwentnie komunikowana na wszystkich poziomach.',
@@ -252,95 +1367,32 @@ with tab_DMS:
         st.markdown("### 📉 Pytania z najniższą średnią:")
         st.write("") 
 
-        for i, (col_name, avg_score) in enumerate(lowest_3.items()):
+        for i, (col_name, avg_score) in enumerate(agg_dms['lowest_3']):
             question = question_dict.get(col_name, col_name)
             st.markdown(f"**„{question}”**")
-            opis = st.text_area(f"👉 Średnia: {avg_score:.2f}", key=f"desc_dms_{col_name}")
+            st.text_area(f"👉 Średnia: {avg_score:.2f}", key=f"desc_{client}_dms_{col_name}")
 
         st.divider() 
 
         # --- 1. RADAR I BOXPLOT ---
-        categories = {
-            's1': 'Infrastruktura Cyfrowa',
-            's2': 'Kultura Organizacyjna i Kompetencje Cyfrowe',
-            's3': 'Przewaga Technologiczna i Innowacyjność',
-            's4': 'Strategia Cyfrowa i Wizja',
-            's5': 'Zarządzanie Danymi'
-        }
-
-        for prefix, cat_name in categories.items():
-            cols = [col for col in df_dms.columns if col.startswith(prefix)]
-            if cols:
-                df_dms[cat_name] = df_dms[cols].mean(axis=1)
-        
-        cat_cols = list(categories.values())
-        print(df_dms.columns)
-        means = df_dms[cat_cols].mean().tolist()
-        mins = df_dms[cat_cols].min().tolist()
-        maxs = df_dms[cat_cols].max().tolist()
-
-        radar_cats = cat_cols + [cat_cols[0]]
-        radar_means = means + [means[0]]
-        radar_mins = mins + [mins[0]]
-        radar_maxs = maxs + [maxs[0]]
-
-        fig_radar = go.Figure()
-
-        fig_radar.add_trace(go.Scatterpolar(
-            r=radar_maxs, theta=radar_cats, mode='lines',
-            line=dict(color='#ff4b4b', dash='dash', width=1.5), name='Maksymalna'
-        ))
-        fig_radar.add_trace(go.Scatterpolar(
-            r=radar_mins, theta=radar_cats, mode='lines',
-            line=dict(color='#ff7f0e', dash='dash', width=1.5), name='Minimalna'
-        ))
-        fig_radar.add_trace(go.Scatterpolar(
-            r=radar_means, theta=radar_cats, fill='toself',
-            fillcolor='rgba(245, 166, 35, 0.4)', 
-            line=dict(color='#f5a623', width=2), name='Średnia'
-        ))
-
-        fig_radar.update_layout(
-            polar=dict(radialaxis=dict(visible=True, range=[0, 10])),
-            showlegend=True,
-            legend=dict(yanchor="bottom", y=-0.3, xanchor="left", x=0),
-            margin=dict(l=40, r=40, t=20, b=20)
-        )
-
-        df_melted = df_dms.melt(value_vars=cat_cols, var_name='Kategoria', value_name='Ocena')
-
-        fig_box = px.box(
-            df_melted, x='Kategoria', y='Ocena', color='Kategoria',
-            color_discrete_sequence=['#E39B20', '#D46A40', '#D8445F', '#DE68B5', '#4B8BBE'] 
-        )
-
-        fig_box.update_layout(
-            showlegend=False, 
-            xaxis_title=None, 
-            yaxis=dict(range=[0, 10.5]),
-            margin=dict(l=20, r=20, t=20, b=20)
-        )
+        fig_radar = cached_figure(build_radar_figure, agg_dms)
+        fig_box = cached_figure(build_box_figure, agg_dms, ['#E39B20', '#D46A40', '#D8445F', '#DE68B5', '#4B8BBE'])
 
         col_left, col_right = st.columns(2)
 
         with col_left:
-            st.plotly_chart(fig_radar, use_container_width=True)
+            radar_event = st.plotly_chart(
+                fig_radar, use_container_width=True,
+                on_select="rerun", selection_mode="points", key=f"radar_{client}_dms"
+            )
 
         with col_right:
             st.plotly_chart(fig_box, use_container_width=True)
 
-        # --- 2. NPS I ANALIZA ---
-        def calc_nps(series):
-            promoters = (series >= 9).sum()
-            detractors = (series <= 6).sum()
-            total = len(series)
-            if total == 0: return 0
-            return ((promoters - detractors) / total) * 100
-
-        nps_data = {cat: calc_nps(df_dms[cat]) for cat in cat_cols}
-        
-        df_nps = pd.DataFrame(list(nps_data.items()), columns=['Kategoria', 'NPS']).sort_values('NPS')
+        show_benchmark_ranks(benchmark_store, benchmark_own_scores, 'dms', agg_dms)
+        show_extreme_respondents(radar_selection(radar_event, agg_dms['categories']), client, data_root, dedup_policy, 'dms')
 
+        # --- 2. NPS I ANALIZA ---
         color_map = {
             'Infrastruktura Cyfrowa': '#E39B20', 
             'Kultura Organizacyjna i Kompetencje Cyfrowe': '#D46A40', 
@@ -348,30 +1400,9 @@ with tab_DMS:
             'Strategia Cyfrowa i Wizja': '#DE68B5',
             'Zarządzanie Danymi': '#4B8BBE'
         }
-        df_nps['Color'] = df_nps['Kategoria'].map(color_map)
-
-        fig_nps = go.Figure(go.Bar(
-            x=df_nps['Kategoria'],
-            y=df_nps['NPS'],
-            marker_color=df_nps['Color'],
-            text=[f"{val:.1f}%" for val in df_nps['NPS']],
-            textposition='outside'
-        ))
+        fig_nps = cached_figure(build_nps_figure, agg_dms, color_map)
 
-        fig_nps.update_layout(
-            title=dict(text="NPS dla każdej kategorii DMS", x=0.5),
-            yaxis=dict(range=[-100, 100], title="NPS (%)", zeroline=True, zerolinecolor='black'),
-            xaxis=dict(title="Kategoria"),
-            showlegend=False,
-            margin=dict(l=40, r=40, t=40, b=40)
-        )
-
-        analysis_path = Path("analysis") / "dms.txt"
-        if analysis_path.exists():
-            with open(analysis_path, "r", encoding="utf-8") as f:
-                analysis_text = f.read()
-        else:
-            analysis_text = "**Brak pliku:** Utwórz plik `analysis/dms.txt`, aby wyświetlić tutaj wnioski."
+        analysis_text = read_analysis_text(client, data_root)
 
         st.write("---")
         
@@ -389,14 +1420,13 @@ with tab_DMS:
 # ==========================================
 with tab_OHIx:
     st.title("Panel 3: OHIx")
-    df_ohix = load_survey_data("ohix")
-    if df_ohix.empty:
+    show_duplicates_info(aggregates['duplicates']['ohix'], dedup_policy)
+    agg_ohix = aggregates['ohix']
+    
+    if agg_ohix is None:
         st.warning("No OHIx data available.")
     else:
         # --- 0. TRZY PYTANIA Z NAJNIŻSZĄ ŚREDNIĄ ---
-        question_cols = [col for col in df_ohix.columns if '-' in col]
-        lowest_3 = df_ohix[question_cols].mean().nsmallest(3)
-
         question_dict = {
             's1-1': 'Organizacja ma jasną i inspirującą wizję, która wyznacza kierunek strategiczny.',
             's1-2': 'Liderzy aktywnie komunikują cele i priorytety organizacji w sposób spójny i zrozumiały.',
@@ -428,95 +1458,32 @@ with tab_OHIx:
         st.markdown("### 📉 Pytania z najniższą średnią:")
         st.write("") 
 
-        for i, (col_name, avg_score) in enumerate(lowest_3.items()):
+        for i, (col_name, avg_score) in enumerate(agg_ohix['lowest_3']):
             question = question_dict.get(col_name, col_name)
             st.markdown(f"**„{question}”**")
-            st.text_area(f"👉 Średnia: {avg_score:.2f}", key=f"desc_ohix_{col_name}")
+            st.text_area(f"👉 Średnia: {avg_score:.2f}", key=f"desc_{client}_ohix_{col_name}")
 
         st.divider() 
 
         # --- 1. RADAR I BOXPLOT ---
-        categories = {
-            's1': 'Dobrostan i Rozwój Pracowników',
-            's2': 'Kultura i Wartości',
-            's3': 'Przywództwo i Wizja',
-            's4': 'Strategia i Koordynacja',
-            's5': 'Zaangażowanie i Współpraca w Zespole'
-        }
-
-        for prefix, cat_name in categories.items():
-            cols = [col for col in df_ohix.columns if col.startswith(prefix)]
-            if cols:
-                df_ohix[cat_name] = df_ohix[cols].mean(axis=1)
-        
-        cat_cols = list(categories.values())
-
-        means = df_ohix[cat_cols].mean().tolist()
-        mins = df_ohix[cat_cols].min().tolist()
-        maxs = df_ohix[cat_cols].max().tolist()
-
-        radar_cats = cat_cols + [cat_cols[0]]
-        radar_means = means + [means[0]]
-        radar_mins = mins + [mins[0]]
-        radar_maxs = maxs + [maxs[0]]
-
-        fig_radar = go.Figure()
-
-        fig_radar.add_trace(go.Scatterpolar(
-            r=radar_maxs, theta=radar_cats, mode='lines',
-            line=dict(color='#ff4b4b', dash='dash', width=1.5), name='Maksymalna'
-        ))
-        fig_radar.add_trace(go.Scatterpolar(
-            r=radar_mins, theta=radar_cats, mode='lines',
-            line=dict(color='#ff7f0e', dash='dash', width=1.5), name='Minimalna'
-        ))
-        fig_radar.add_trace(go.Scatterpolar(
-            r=radar_means, theta=radar_cats, fill='toself',
-            fillcolor='rgba(245, 166, 35, 0.4)', 
-            line=dict(color='#f5a623', width=2), name='Średnia'
-        ))
-
-        fig_radar.update_layout(
-            polar=dict(radialaxis=dict(visible=True, range=[0, 10])),
-            showlegend=True,
-            legend=dict(yanchor="bottom", y=-0.3, xanchor="left", x=0),
-            margin=dict(l=40, r=40, t=20, b=20)
-        )
-
-        df_melted = df_ohix.melt(value_vars=cat_cols, var_name='Kategoria', value_name='Ocena')
-
-        fig_box = px.box(
-            df_melted, x='Kategoria', y='Ocena', color='Kategoria',
-            color_discrete_sequence=['#E39B20', '#D46A40', '#D8445F', '#DE68B5', '#4B8BBE'] 
-        )
-
-        fig_box.update_layout(
-            showlegend=False, 
-            xaxis_title=None, 
-            yaxis=dict(range=[0, 10.5]),
-            margin=dict(l=20, r=20, t=20, b=20)
-        )
+        fig_radar = cached_figure(build_radar_figure, agg_ohix)
+        fig_box = cached_figure(build_box_figure, agg_ohix, ['#E39B20', '#D46A40', '#D8445F', '#DE68B5', '#4B8BBE'])
 
         col_left, col_right = st.columns(2)
 
         with col_left:
-            st.plotly_chart(fig_radar, use_container_width=True)
+            radar_event = st.plotly_chart(
+                fig_radar, use_container_width=True,
+                on_select="rerun", selection_mode="points", key=f"radar_{client}_ohix"
+            )
 
         with col_right:
             st.plotly_chart(fig_box, use_container_width=True)
 
-        # --- 2. NPS I ANALIZA ---
-        def calc_nps(series):
-            promoters = (series >= 9).sum()
-            detractors = (series <= 6).sum()
-            total = len(series)
-            if total == 0: return 0
-            return ((promoters - detractors) / total) * 100
-
-        nps_data = {cat: calc_nps(df_ohix[cat]) for cat in cat_cols}
-        
-        df_nps = pd.DataFrame(list(nps_data.items()), columns=['Kategoria', 'NPS']).sort_values('NPS')
+        show_benchmark_ranks(benchmark_store, benchmark_own_scores, 'ohix', agg_ohix)
+        show_extreme_respondents(radar_selection(radar_event, agg_ohix['categories']), client, data_root, dedup_policy, 'ohix')
 
+        # --- 2. NPS I ANALIZA ---
         color_map = {
             'Dobrostan i Rozwój Pracowników': '#E39B20', 
             'Kultura i Wartości': '#D46A40', 
@@ -524,30 +1491,9 @@ with tab_OHIx:
             'Strategia i Koordynacja': '#DE68B5',
             'Zaangażowanie i Współpraca w Zespole': '#4B8BBE'
         }
-        df_nps['Color'] = df_nps['Kategoria'].map(color_map)
-
-        fig_nps = go.Figure(go.Bar(
-            x=df_nps['Kategoria'],
-            y=df_nps['NPS'],
-            marker_color=df_nps['Color'],
-            text=[f"{val:.1f}%" for val in df_nps['NPS']],
-            textposition='outside'
-        ))
-
-        fig_nps.update_layout(
-            title=dict(text="NPS dla każdej kategorii DMS", x=0.5),
-            yaxis=dict(range=[-100, 100], title="NPS (%)", zeroline=True, zerolinecolor='black'),
-            xaxis=dict(title="Kategoria"),
-            showlegend=False,
-            margin=dict(l=40, r=40, t=40, b=40)
-        )
+        fig_nps = cached_figure(build_nps_figure, agg_ohix, color_map)
 
-        analysis_path = Path("analysis") / "dms.txt"
-        if analysis_path.exists():
-            with open(analysis_path, "r", encoding="utf-8") as f:
-                analysis_text = f.read()
-        else:
-            analysis_text = "**Brak pliku:** Utwórz plik `analysis/dms.txt`, aby wyświetlić tutaj wnioski."
+        analysis_text = read_analysis_text(client, data_root)
 
         st.write("---")
         
@@ -563,203 +1509,24 @@ with tab_OHIx:
 # ==========================================
 # MetaCategories TAB
 # ==========================================
-
-def calculate_bounds(formula):
-    """
-    Analizuje formułę i oblicza wynik dla wszystkich zmiennych = 1 (min) oraz = 10 (max).
-    Zakłada format: prefix_sX_Y * waga
-    """
-    weights = re.findall(r'\*\s*([0-9.]+)', formula)
-    weights = [float(w) for w in weights]
-    
-    theo_min = sum(weights) * 1
-    theo_max = sum(weights) * 10
-    return theo_min, theo_max
-
 with tab_Meta:
     st.title("Panel 4: Analiza Metakategorii")
     
-    df_hsc = load_survey_data("hsc")
-    df_dms = load_survey_data("dms")
-    df_ohix = load_survey_data("ohix")
-    
-    if df_hsc.empty or df_dms.empty or df_ohix.empty:
+    if aggregates['meta'] is None:
         st.warning("Brakuje danych w jednym z folderów (hsc, dms, ohix).")
     else:
-        # Łączenie danych
-        min_len = min(len(df_hsc), len(df_dms), len(df_ohix))
-        df_combined = pd.DataFrame()
-        
-        for df, prefix in zip([df_hsc, df_dms, df_ohix], ["hsc", "dms", "ohix"]):
-            for col in df.columns:
-                if '-' in col:
-                    clean_col = col.replace('-', '_')
-                    df_combined[f"{prefix}_{clean_col}"] = df[col].iloc[:min_len].values
-
-        meta_formulas = {
-            'Strategia i Wizja': 'hsc_s1_1 * 0.2 + hsc_s1_2 * 0.4 + hsc_s1_3 * 0.3 + hsc_s1_4 * 0.2 + hsc_s1_5 * 0.5 + hsc_s2_1 * 0.6 + hsc_s2_2 * 0.5 + hsc_s2_3 * 0.5 + hsc_s2_4 * 0.7 + hsc_s2_5 * 0.4 + hsc_s4_1 * 0.4 + hsc_s4_3 * 0.3 + hsc_s4_4 * 0.4 + dms_s1_1 * 0.6 + dms_s1_2 * 0.6 + dms_s1_3 * 0.6 + dms_s1_4 * 0.5 + dms_s1_5 * 0.5 + dms_s2_4 * 0.3 + dms_s2_5 * 0.3 + dms_s3_1 * 0.3 + dms_s5_1 * 0.3 + ohix_s1_1 * 0.4 + ohix_s1_2 * 0.3 + ohix_s1_3 * 0.2 + ohix_s1_4 * 0.4 + ohix_s1_5 * 0.1 + ohix_s2_1 * 0.5 + ohix_s2_2 * 0.3 + ohix_s2_3 * 0.2 + ohix_s2_4 * 0.2 + ohix_s2_5 * 0.2 + ohix_s4_3 * 0.2 + ohix_s4_4 * 0.1 + ohix_s5_2 * 0.1',
-
-            'Pozycjonowanie Rynkowe': 'hsc_s1_1 * 0.8 + hsc_s1_2 * 0.6 + hsc_s1_3 * 0.7 + hsc_s1_4 * 0.5 + hsc_s1_5 * 0.5 + hsc_s2_1 * 0.4 + hsc_s3_2 * 0.3 + hsc_s3_3 * 0.2 + dms_s2_5 * 0.1 + ohix_s2_4 * 0.2',
-
-            'Portfolio (Produkty/Usługi)': 'hsc_s3_1 * 0.7 + hsc_s3_2 * 0.5 + hsc_s3_3 * 0.6 + hsc_s3_4 * 0.6 + hsc_s3_5 * 0.5 + dms_s2_2 * 0.2',
-
-            'Technologia i Innowacyjność': 'dms_s1_1 * 0.4 + dms_s1_2 * 0.4 + dms_s1_3 * 0.4 + dms_s1_4 * 0.5 + dms_s1_5 * 0.5 + dms_s2_1 * 0.6 + dms_s2_2 * 0.6 + dms_s2_3 * 0.6 + dms_s2_4 * 0.5 + dms_s2_5 * 0.4 + dms_s3_1 * 0.4 + dms_s3_3 * 0.3 + dms_s3_4 * 0.3 + dms_s4_1 * 0.3 + dms_s4_2 * 0.3 + dms_s4_3 * 0.4 + dms_s4_4 * 0.4 + dms_s4_5 * 0.5 + dms_s5_1 * 0.3 + dms_s5_2 * 0.3 + dms_s5_3 * 0.2 + dms_s5_4 * 0.3 + dms_s5_5 * 0.2',
-
-            'Dane i Analityka': 'hsc_s3_4 * 0.2 + hsc_s4_2 * 0.3 + dms_s3_1 * 0.7 + dms_s3_2 * 0.8 + dms_s3_3 * 0.7 + dms_s3_4 * 0.5 + dms_s3_5 * 0.7 + ohix_s4_4 * 0.2',
-
-            'Operacje i Procesy': 'hsc_s1_4 * 0.3 + hsc_s2_4 * 0.3 + hsc_s3_1 * 0.3 + hsc_s3_3 * 0.2 + hsc_s3_4 * 0.2 + hsc_s3_5 * 0.5 + hsc_s4_2 * 0.5 + dms_s2_1 * 0.4 + dms_s2_2 * 0.2 + dms_s3_2 * 0.2 + dms_s3_4 * 0.3 + dms_s5_1 * 0.4 + dms_s5_2 * 0.2 + ohix_s1_3 * 0.2 + ohix_s1_5 * 0.2 + ohix_s2_2 * 0.2 + ohix_s2_4 * 0.2 + ohix_s2_5 * 0.2 + ohix_s3_2 * 0.3 + ohix_s3_3 * 0.2 + ohix_s5_4 * 0.3 + ohix_s5_5 * 0.2',
-
-            'Infrastruktura i zasoby': 'dms_s2_4 * 0.2 + dms_s2_5 * 0.2 + dms_s3_5 * 0.3 + dms_s5_2 * 0.6 + dms_s5_3 * 0.8 + dms_s5_4 * 0.7 + dms_s5_5 * 0.8',
-
-            'Ludzie i Kultura Organizacyjna': 'hsc_s2_2 * 0.2 + hsc_s2_5 * 0.3 + hsc_s4_1 * 0.2 + hsc_s4_3 * 0.7 + hsc_s4_4 * 0.2 + hsc_s4_5 * 0.4 + dms_s2_3 * 0.5 + dms_s3_4 * 0.2 + dms_s4_1 * 0.7 + dms_s4_2 * 0.7 + dms_s4_3 * 0.6 + dms_s4_4 * 0.6 + dms_s4_5 * 0.5 + ohix_s1_1 * 0.3 + ohix_s1_2 * 0.3 + ohix_s1_3 * 0.3 + ohix_s1_4 * 0.2 + ohix_s2_1 * 0.2 + ohix_s2_2 * 0.2 + ohix_s3_1 * 0.5 + ohix_s3_2 * 0.3 + ohix_s3_3 * 0.3 + ohix_s3_4 * 0.4 + ohix_s3_5 * 0.5 + ohix_s4_1 * 0.7 + ohix_s4_2 * 0.6 + ohix_s4_3 * 0.5 + ohix_s4_4 * 0.4 + ohix_s4_5 * 0.5 + ohix_s5_1 * 0.6 + ohix_s5_2 * 0.5 + ohix_s5_3 * 0.7 + ohix_s5_4 * 0.5 + ohix_s5_5 * 0.4',
+        for error in aggregates['meta']['errors']:
+            st.error(error)
 
-            'Harmonia i Przywództwo': 'hsc_s2_3 * 0.5 + hsc_s3_2 * 0.2 + hsc_s4_2 * 0.2 + hsc_s4_5 * 0.6 + ohix_s1_1 * 0.3 + ohix_s1_2 * 0.4 + ohix_s1_3 * 0.4 + ohix_s1_4 * 0.4 + ohix_s1_5 * 0.3 + ohix_s2_1 * 0.3 + ohix_s2_2 * 0.5 + ohix_s2_3 * 0.4 + ohix_s2_4 * 0.4 + ohix_s2_5 * 0.4 + ohix_s3_1 * 0.5 + ohix_s3_2 * 0.4 + ohix_s3_3 * 0.5 + ohix_s3_4 * 0.3 + ohix_s3_5 * 0.5 + ohix_s4_1 * 0.3 + ohix_s4_2 * 0.2 + ohix_s4_3 * 0.3 + ohix_s4_4 * 0.3 + ohix_s4_5 * 0.5 + ohix_s5_1 * 0.4 + ohix_s5_2 * 0.4 + ohix_s5_3 * 0.3 + ohix_s5_4 * 0.5 + ohix_s5_5 * 0.4'
-        }
-
-        stats_list = []
-
-        for cat_name, formula in meta_formulas.items():
-            try:
-                real_scores = df_combined.eval(formula)
-                
-                theo_min, theo_max = calculate_bounds(formula)
-                
-                stats_list.append({
-                    'Kategoria': cat_name,
-                    'Theo Min': theo_min,
-                    'Wartość minimalna': real_scores.min(),
-                    'Q1': real_scores.quantile(0.25),
-                    'Mediana': real_scores.median(),
-                    'Średnia': real_scores.mean(),
-                    'Q3': real_scores.quantile(0.75),
-                    'Wartość maksymalna': real_scores.max(),
-                    'Theo Max': theo_max
-                })
-            except Exception as e:
-                st.error(f"Błąd we wzorze '{cat_name}': {e}")
-        
-        df_stats = pd.DataFrame(stats_list)
-
-        # --- WIZUALIZACJA ---
-        fig_meta = go.Figure()
-
-        for _, row in df_stats[::-1].iterrows():
-            fig_meta.add_trace(go.Scatter(
-                x=[row['Theo Min'], row['Theo Max']],
-                y=[row['Kategoria'], row['Kategoria']],
-                mode='lines',
-                line=dict(color='#F0F0F0', width=18),
-                hoverinfo='skip'
-            ))
-            
-            # Świeca
-            fig_meta.add_trace(go.Scatter(
-                x=[row['Wartość minimalna'], row['Wartość maksymalna']],
-                y=[row['Kategoria'], row['Kategoria']],
-                mode='lines',
-                line=dict(color='#333333', width=4),
-                name='Realny zakres'
-            ))
-            
-            # Punkt
-            fig_meta.add_trace(go.Scatter(
-                x=[row['Średnia']],
-                y=[row['Kategoria']],
-                mode='markers',
-                marker=dict(color='#1f77b4', size=10, symbol='diamond'),
-                name='Średnia'
-            ))
-
-        fig_meta.update_layout(
-            showlegend=False, height=550, plot_bgcolor='white',
-            margin=dict(l=10, r=10, t=10, b=10),
-            xaxis=dict(title="Punkty (skalowane wagami)", showgrid=True, gridcolor='#EEEEEE')
-        )
-
-        
-        for col in df_hsc.columns:
-            if '-' in col: df_combined[f"hsc_{col.replace('-', '_')}"] = df_hsc[col].iloc[:min_len]
-        for col in df_dms.columns:
-            if '-' in col: df_combined[f"dms_{col.replace('-', '_')}"] = df_dms[col].iloc[:min_len]
-        for col in df_ohix.columns:
-            if '-' in col: df_combined[f"ohix_{col.replace('-', '_')}"] = df_ohix[col].iloc[:min_len]
-
-
-
-        # --- 2. OBLICZANIE STATYSTYK DO TABELI I WYKRESU ---
-        stats_list = []
-        
-        dummy_min_df = pd.DataFrame(1, index=[0], columns=df_combined.columns)
-        dummy_max_df = pd.DataFrame(10, index=[0], columns=df_combined.columns)
-
-        for cat_name, formula in meta_formulas.items():
-            try:
-                real_scores = df_combined.eval(formula)
-                
-                # Teoretyczne min/max dla szarego tła
-                theo_min = dummy_min_df.eval(formula).iloc[0]
-                theo_max = dummy_max_df.eval(formula).iloc[0]
-                
-                stats_list.append({
-                    'Kategoria': cat_name,
-                    'Theo Min': theo_min,
-                    'Wartość minimalna': real_scores.min(),
-                    'Q1': real_scores.quantile(0.25),
-                    'Mediana': real_scores.median(),
-                    'Średnia': real_scores.mean(),
-                    'Q3': real_scores.quantile(0.75),
-                    'Wartość maksymalna': real_scores.max(),
-                    'Theo Max': theo_max
-                })
-            except Exception as e:
-                st.error(f"Sprawdź wzór dla '{cat_name}'. Błąd: {e}")
-                
-        df_stats = pd.DataFrame(stats_list)
+        df_stats = pd.DataFrame(aggregates['meta']['stats'])
+        meta_ranks = [
+            benchmark_store.percentile_rank(f"meta/{row['Kategoria']}", row['Średnia'], benchmark_own_scores.get(f"meta/{row['Kategoria']}"))
+            for _, row in df_stats.iterrows()
+        ]
+        df_stats['Percentyl'] = [np.nan if rank is None else rank for rank in meta_ranks]
 
         # --- 3. TWORZENIE WYKRESU ---
-        fig_meta = go.Figure()
-        categories = df_stats['Kategoria'][::-1]
-
-        for index, row in df_stats[::-1].iterrows():
-            # 1. Szare tło: Teoretyczne MIN do Teoretyczne MAX
-            fig_meta.add_trace(go.Scatter(
-                x=[row['Theo Min'], row['Theo Max']],
-                y=[row['Kategoria'], row['Kategoria']],
-                mode='lines',
-                line=dict(color='#E0E0E0', width=20),
-                hoverinfo='text',
-                hovertext=f"Zakres teoretyczny: {row['Theo Min']:.1f} - {row['Theo Max']:.1f}"
-            ))
-            
-            # 2. Czarna "świeca": Realne MIN do Realne MAX
-            fig_meta.add_trace(go.Scatter(
-                x=[row['Wartość minimalna'], row['Wartość maksymalna']],
-                y=[row['Kategoria'], row['Kategoria']],
-                mode='lines',
-                line=dict(color='black', width=4),
-                hoverinfo='text',
-                hovertext=f"Realny rozrzut z ankiet: {row['Wartość minimalna']:.1f} - {row['Wartość maksymalna']:.1f}"
-            ))
-            
-            # 3. Niebieska kropka - Średnia
-            fig_meta.add_trace(go.Scatter(
-                x=[row['Średnia']],
-                y=[row['Kategoria']],
-                mode='markers+text',
-                marker=dict(color='blue', size=8),
-                text=[f"{row['Średnia']:.1f}"],
-                textposition='bottom center',
-                textfont=dict(color='blue', size=10)
-            ))
-
-        fig_meta.update_layout(
-            showlegend=False,
-            height=500,
-            margin=dict(l=20, r=20, t=20, b=20),
-            xaxis=dict(gridcolor='lightgray', showline=True, linecolor='black'),
-            yaxis=dict(gridcolor='lightgray'),
-            plot_bgcolor='white'
-        )
+        fig_meta = cached_figure(build_meta_figure, aggregates['meta']['stats'])
 
         # --- 4. WYŚWIETLANIE NA DASHBOARDZIE ---
         col_text, col_chart = st.columns([1, 2])
@@ -768,8 +1535,51 @@ with tab_Meta:
             st.markdown("### 🔍 Co możemy wyczytać z tego wykresu?")
 
         with col_chart:
-            st.plotly_chart(fig_meta, use_container_width=True)
-            display_cols = ['Kategoria', 'Wartość minimalna', 'Q1', 'Mediana', 'Średnia', 'Q3', 'Wartość maksymalna']
+            meta_event = st.plotly_chart(
+                fig_meta, use_container_width=True,
+                on_select="rerun", selection_mode="points", key=f"meta_chart_{client}"
+            )
+            display_cols = ['Kategoria', 'Wartość minimalna', 'Q1', 'Mediana', 'Średnia', 'Q3', 'Wartość maksymalna', 'Percentyl']
             df_stats_display = df_stats[display_cols].set_index('Kategoria').round(2)
             st.dataframe(df_stats_display, use_container_width=True)
 
+        show_extreme_respondents(meta_selection(meta_event, df_stats), client, data_root, dedup_policy, 'meta')
+
+
+# ==========================================
+# Respondenci TAB
+# ==========================================
+with tab_Respondents:
+    st.title("Panel 5: Respondenci")
+    st.caption("Najniższe i najwyższe wyniki w wybranej kategorii, stronicowane po stronie serwera. "
+               "Kliknięcie minimum/maksimum na radarze lub końca świecy na wykresie metakategorii pokazuje to samo przy wykresie.")
+
+    if not st.toggle("Wczytaj dane respondentów", key="drill_enabled"):
+        st.info("Dane respondentów są wczytywane dopiero na żądanie.")
+    else:
+        respondent_indexes = load_respondent_indexes(data_root, dedup_policy)
+        panel_labels = {'hsc': 'HSC', 'dms': 'DMS', 'ohix': 'OHIx', 'meta': 'MetaCategories'}
+        panels = [panel for panel in panel_labels if panel in respondent_indexes]
+
+        if not panels:
+            st.warning("Brak danych respondentów.")
+        else:
+            col_panel, col_axis, col_order = st.columns(3)
+            panel = col_panel.selectbox("Panel", panels, format_func=panel_labels.get, key=f"drill_tab_{client}_panel")
+            index = respondent_indexes[panel]
+            axis = col_axis.selectbox("Kategoria", list(index.scores.columns), key=f"drill_tab_{client}_{panel}_axis")
+            order = col_order.radio("Kolejność", ["Najniższe", "Najwyższe"], horizontal=True, key=f"drill_tab_{client}_order")
+
+            for error in index.errors:
+                st.error(error)
+
+            show_respondent_page(index, axis, order == "Najniższe", key=f"drill_tab_{client}")
+
+
+shared_cache = get_shared_cache()
+figure_stats = get_figure_stats()
+cache_caption.caption(
+    f"Cache: {shared_cache.used_bytes / 1024 / 1024:.1f} / {CACHE_BUDGET_MB} MB, wpisów: {len(shared_cache)}  \n"
+    f"Wykresy: trafienia {figure_stats.hits}, budowane {figure_stats.misses} "
+    f"({figure_stats.build_seconds * 1000:.0f} ms łącznie)"
+)